@@ -1,6 +1,21 @@
 import streamlit as st
-import autopep8
-import requests
+
+from formatters import (
+    FormatterUnavailableError,
+    format_python_code,
+    format_sas_code,
+    format_vba_code,
+)
+
+# Uploads larger than this are rejected before being decoded
+MAX_UPLOAD_BYTES = 2_000_000
+
+# Syntax-highlighting language for each selectable language
+LANG_MAP = {
+    "Python": "python",
+    "SAS": "sas",
+    "VBA": "vba"
+}
 
 st.set_page_config(
     layout="wide",
@@ -59,193 +74,41 @@ st.markdown(
 
 # -------------------- Utility Functions -------------------- #
 
-def preprocess_code_python(raw_code: str) -> str:
-    """
-    For Python code only:
-    - Convert uppercase 'If', 'Else:' etc. to lowercase 'if', 'else:' to fix
-      partial syntax problems.
+@st.cache_data(ttl=300, show_spinner=False)
+def _fetch_url(url: str) -> str:
     """
-    replacements = {
-        "Else:": "else:",
-        "Elif ": "elif ",
-        "If ": "if ",
-        "While ": "while ",
-        "For ": "for ",
-    }
-    lines = raw_code.splitlines(keepends=True)
-    new_lines = []
-    for line in lines:
-        for old, new in replacements.items():
-            if old in line:
-                line = line.replace(old, new)
-        new_lines.append(line)
-    return "".join(new_lines)
+    Fetch a code file over HTTP and return its text.
 
-
-def fix_block_indentation_python(raw_code: str, indent_size: int = 4) -> str:
-    """
-    A simplified approach to fix indentation for Python block structures.
-    This is not a perfect solution but helps in some basic cases.
-    """
-    lines = raw_code.splitlines()
-    block_keywords = (
-        "if ", "elif ", "else:", "for ", "while ",
-        "def ", "class ", "with ", "try:", "except "
-    )
-    processed_lines = []
-    for line in lines:
-        stripped_line = line.lstrip()
-        leading_spaces = len(line) - len(stripped_line)
-        processed_lines.append([line, leading_spaces])
-
-    i = 0
-    while i < len(processed_lines):
-        line, indent_level = processed_lines[i]
-        line_stripped = line.strip()
-        if line_stripped.endswith(":"):
-            lower_stripped = line_stripped.lower()
-            if any(lower_stripped.startswith(kw) for kw in block_keywords):
-                j = i + 1
-                while j < len(processed_lines):
-                    next_line, next_indent = processed_lines[j]
-                    next_stripped = next_line.strip()
-                    # Skip blank lines
-                    if not next_stripped:
-                        j += 1
-                        continue
-                    # If next line is not more-indented, fix it
-                    if next_indent <= indent_level:
-                        needed_indent = indent_level + indent_size
-                        new_line = " " * needed_indent + next_stripped
-                        processed_lines[j] = [new_line, needed_indent]
-                    break
-        i += 1
-    return "\n".join(item[0] for item in processed_lines)
-
-
-def format_python_code(raw_code: str, block_fix_passes: int) -> str:
-    """
-    Full pipeline for Python code formatting:
-      1) Preprocess uppercase keywords
-      2) Attempt repeated block indentation fixes
-      3) Use autopep8 for final pass(es)
+    Cached per URL for a few minutes so Streamlit reruns triggered by other
+    widgets don't re-download the file each time. Non-200 responses raise
+    requests.HTTPError instead, which st.cache_data does not cache, so a
+    transient failure is retried on the next rerun.
     """
-    # Step 1: Preprocess
-    code_step1 = preprocess_code_python(raw_code)
-
-    # Step 2: Indentation fixes
-    code_step2 = code_step1
-    for _ in range(block_fix_passes):
-        code_step2 = fix_block_indentation_python(code_step2, indent_size=4)
-
-    # Step 3: autopep8 (two passes)
-    try:
-        pass1 = autopep8.fix_code(
-            code_step2,
-            options={
-                "aggressive": 2,
-                "experimental": True,
-                "indent_size": 4
-            }
-        )
-        pass2 = autopep8.fix_code(
-            pass1,
-            options={
-                "aggressive": 2,
-                "experimental": True,
-                "indent_size": 4
-            }
+    # Imported here so start-up doesn't pay for the urllib3 import chain
+    import requests
+
+    response = requests.get(url, timeout=10)
+    if response.status_code != 200:
+        raise requests.HTTPError(
+            f"Status code: {response.status_code}", response=response
         )
-        return pass2
-    except Exception as e:
-        # If autopep8 fails (e.g., syntax error), return partial result
-        return code_step2
+    return response.text
 
 
-def minimal_cleanup_for_non_python(raw_code: str) -> str:
-    """
-    A minimal cleanup approach:
-      - Strip trailing spaces
-      - Remove excessive empty lines
-    """
-    lines = raw_code.split("\n")
-    lines = [line.rstrip() for line in lines]
-    cleaned_lines = []
-    last_line_blank = False
-    for line in lines:
-        if line.strip() == "":
-            if last_line_blank:
-                continue
-            last_line_blank = True
-        else:
-            last_line_blank = False
-        cleaned_lines.append(line)
-    return "\n".join(cleaned_lines)
-
-
-def format_sas_code(raw_code: str) -> str:
-    """
-    A basic formatter for SAS code:
-      - Cleans up extra spaces and empty lines.
-      - Applies simple block indentation based on common SAS keywords.
-    """
-    cleaned = minimal_cleanup_for_non_python(raw_code)
-    lines = cleaned.split("\n")
-    formatted_lines = []
-    indent_level = 0
-
-    # Keywords to start a block and to end a block in SAS
-    sas_block_start = ("proc ", "data ")
-    sas_block_end = ("run;", "quit;")
-
-    for line in lines:
-        stripped = line.strip()
-        lower_stripped = stripped.lower()
-        # Check if the line signals the end of a block
-        if any(lower_stripped.startswith(kw) for kw in sas_block_end):
-            indent_level = max(indent_level - 1, 0)
-            formatted_lines.append("    " * indent_level + stripped)
-        else:
-            formatted_lines.append("    " * indent_level + stripped)
-            if any(lower_stripped.startswith(kw) for kw in sas_block_start):
-                indent_level += 1
-
-    return "\n".join(formatted_lines)
-
-
-def format_vba_code(raw_code: str) -> str:
+@st.cache_data(max_entries=64, show_spinner=False)
+def _format_code(language: str, raw_code: str, fix_blocks: bool) -> str:
     """
-    A basic formatter for VBA code:
-      - Cleans up extra spaces and empty lines.
-      - Applies simple block indentation based on common VBA block keywords.
+    Format raw_code with the formatter for the selected language.
+
+    Cached across reruns and sessions, so formatting identical input again
+    skips the whole pipeline. FormatterUnavailableError propagates, so
+    transient autopep8 failures are never cached.
     """
-    cleaned = minimal_cleanup_for_non_python(raw_code)
-    lines = cleaned.split("\n")
-    formatted_lines = []
-    indent_level = 0
-
-    # Define VBA block starting and ending keywords
-    vba_block_start = ("sub ", "function ", "if ", "for ", "while ", "select case", "with")
-    vba_block_end = ("end sub", "end function", "end if", "next", "wend", "end select", "end with")
-
-    for line in lines:
-        stripped = line.strip()
-        lower_stripped = stripped.lower()
-        # Check if the line is a block-ending keyword
-        if any(lower_stripped.startswith(kw) for kw in vba_block_end):
-            indent_level = max(indent_level - 1, 0)
-            formatted_lines.append("    " * indent_level + stripped)
-        # Special handling for Else to align with If
-        elif lower_stripped == "else" or lower_stripped.startswith("else "):
-            indent_level = max(indent_level - 1, 0)
-            formatted_lines.append("    " * indent_level + stripped)
-            indent_level += 1
-        else:
-            formatted_lines.append("    " * indent_level + stripped)
-            if any(lower_stripped.startswith(kw) for kw in vba_block_start):
-                indent_level += 1
-
-    return "\n".join(formatted_lines)
+    if language == "Python":
+        return format_python_code(raw_code, fix_blocks)
+    if language == "SAS":
+        return format_sas_code(raw_code)
+    return format_vba_code(raw_code)
 
 
 # --------------------- Main App Function --------------------- #
@@ -293,16 +156,26 @@ def main():
         elif input_mode == "📁 Upload File":
             uploaded_file = st.file_uploader("Upload a source file", type=["py", "txt", "sas", "bas"])
             if uploaded_file is not None:
-                code_input_temp = uploaded_file.read().decode("utf-8")
+                if uploaded_file.size > MAX_UPLOAD_BYTES:
+                    st.error(
+                        f"File too large ({uploaded_file.size:,} bytes). "
+                        f"Maximum is {MAX_UPLOAD_BYTES:,} bytes."
+                    )
+                else:
+                    # Decode straight from the upload's in-memory buffer;
+                    # read() would first copy the whole file into a new
+                    # bytes object
+                    with uploaded_file.getbuffer() as data:
+                        code_input_temp = str(data, "utf-8", "replace")
         else:  # "🌐 Fetch from URL"
             code_url = st.text_input("Enter the URL of your code file:")
             if code_url:
+                import requests
+
                 try:
-                    response = requests.get(code_url)
-                    if response.status_code == 200:
-                        code_input_temp = response.text
-                    else:
-                        st.warning(f"Failed to fetch file. Status code: {response.status_code}")
+                    code_input_temp = _fetch_url(code_url)
+                except requests.HTTPError as e:
+                    st.warning(f"Failed to fetch file. Status code: {e.response.status_code}")
                 except Exception as e:
                     st.error(f"Error fetching file: {e}")
 
@@ -318,26 +191,25 @@ def main():
             index=0
         )
 
-        block_fix_passes = 0
+        fix_blocks = False
         if selected_language == "Python":
-            block_fix_passes = st.slider(
-                "Block Indentation Fix Passes (Python only)",
-                min_value=0,
-                max_value=3,
-                value=1
+            fix_blocks = st.checkbox(
+                "Fix Block Indentation (Python only)",
+                value=True
             )
 
         if st.button("✨ Format & Refine Code"):
             raw_code = st.session_state["input_code"].strip()
             if raw_code:
-                if selected_language == "Python":
-                    formatted = format_python_code(raw_code, block_fix_passes)
-                    st.session_state["formatted_code"] = formatted
-                elif selected_language == "SAS":
-                    formatted = format_sas_code(raw_code)
-                    st.session_state["formatted_code"] = formatted
-                elif selected_language == "VBA":
-                    formatted = format_vba_code(raw_code)
+                if selected_language in LANG_MAP:
+                    try:
+                        formatted = _format_code(selected_language, raw_code, fix_blocks)
+                    except FormatterUnavailableError as e:
+                        message = f"{e}; showing the code without the autopep8 pass."
+                        if e.can_retry:
+                            message += " Click Format again to retry."
+                        st.warning(message)
+                        formatted = e.partial
                     st.session_state["formatted_code"] = formatted
                 else:
                     st.warning("Unsupported language selected.")
@@ -363,12 +235,7 @@ def main():
             )
 
         # Apply syntax highlighting based on selected language
-        lang_map = {
-            "Python": "python",
-            "SAS": "sas",
-            "VBA": "vba"
-        }
-        highlight_language = lang_map.get(selected_language, "text")
+        highlight_language = LANG_MAP.get(selected_language, "text")
         st.code(st.session_state["formatted_code"], language=highlight_language, line_numbers=True)
 
     st.markdown('<hr class="bottom-line" />', unsafe_allow_html=True)
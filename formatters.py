@@ -0,0 +1,359 @@
+"""
+Pure-Python formatting helpers used by the Streamlit app.
+
+autopep8 and pycodestyle are imported inside the Python formatting path
+only, so SAS/VBA use and app start-up never load them.
+
+Kept free of Streamlit and fully typed (Final constants, typed locals) so
+the module can be compiled with mypyc (see setup.py); app.py imports it
+the same way either way.
+"""
+import ast
+import logging
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Final, List, Optional, Pattern, Tuple
+
+_log = logging.getLogger(__name__)
+
+# Uppercase keyword typos rewritten by preprocess_code_python, matched in a
+# single pass over the whole buffer.
+_KW_MAP: Final[Dict[str, str]] = {
+    "Else:": "else:",
+    "Elif ": "elif ",
+    "If ": "if ",
+    "While ": "while ",
+    "For ": "for ",
+}
+_KW_RE: Final[Pattern[str]] = re.compile(
+    r"\b(?:" + "|".join(map(re.escape, _KW_MAP)) + ")"
+)
+
+# Line prefixes that open a Python block; a tuple so str.startswith can test
+# them all in one call.
+_PY_BLOCK_KW: Final[Tuple[str, ...]] = (
+    "if ", "elif ", "else:", "for ", "while ",
+    "def ", "class ", "with ", "try:", "except "
+)
+
+# Whitespace (other than the newline itself) at the end of each line
+_TRAILING_WS: Final[Pattern[str]] = re.compile(r"[^\S\n]+$", re.MULTILINE)
+# A newline that both follows and precedes an empty line: removing it drops
+# the second of two consecutive blank lines
+_REPEATED_BLANK: Final[Pattern[str]] = re.compile(r"(?<![^\n])\n(?=\n|\Z)")
+
+# Block keywords for the SAS and VBA formatters, matched (with .match, so
+# anchored at the start) against the lowercased, stripped line
+_SAS_START: Final[Pattern[str]] = re.compile(r"proc |data ")
+_SAS_END: Final[Pattern[str]] = re.compile(r"run;|quit;")
+_VBA_START: Final[Pattern[str]] = re.compile(
+    r"sub |function |if |for |while |select case|with"
+)
+_VBA_END: Final[Pattern[str]] = re.compile(
+    r"end sub|end function|end if|next|wend|end select|end with"
+)
+_VBA_ELSE: Final[Pattern[str]] = re.compile(r"else(?: |\Z)")
+
+# Options for the final autopep8 pass (autopep8 only reads this dict)
+_AUTOPEP8_OPTIONS: Final[Dict[str, object]] = {
+    "aggressive": 2,
+    "experimental": True,
+    "indent_size": 4
+}
+# Seconds to wait for a pooled autopep8 run before giving up
+_AUTOPEP8_TIMEOUT: Final[float] = 30.0
+
+# The shared autopep8 worker pool; created and replaced under _POOL_LOCK
+_POOL_LOCK: Final = threading.Lock()
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+class FormatterUnavailableError(Exception):
+    """
+    The autopep8 worker pool failed or timed out. Transient, so raised
+    rather than returned, keeping result caches from storing it; `partial`
+    holds the code as it was before the autopep8 step. `can_retry` is False
+    for timeouts, where running the same input again would likely time out
+    again.
+    """
+
+    def __init__(
+        self, message: str, partial: str, can_retry: bool = True
+    ) -> None:
+        super().__init__(message)
+        self.partial = partial
+        self.can_retry = can_retry
+
+
+def preprocess_code_python(raw_code: str) -> str:
+    """
+    For Python code only:
+    - Convert uppercase 'If', 'Else:' etc. to lowercase 'if', 'else:' to fix
+      partial syntax problems.
+    """
+    return _KW_RE.sub(lambda m: _KW_MAP[m.group(0)], raw_code)
+
+
+def fix_block_indentation_python(raw_code: str, indent_size: int = 4) -> str:
+    """
+    A simplified approach to fix indentation for Python block structures.
+    This is not a perfect solution but helps in some basic cases.
+
+    Runs as a single linear pass: a fix to a line is visible when that line
+    is itself a block header, so repeating the pass changes nothing.
+    """
+    lines = raw_code.splitlines()
+    # Indent of the last block header whose body has not been seen yet
+    pending_indent: Optional[int] = None
+    for i, line in enumerate(lines):
+        line_stripped = line.strip()
+        # Skip blank lines
+        if not line_stripped:
+            continue
+        indent_level = len(line) - len(line.lstrip())
+        # If the body line is not more-indented than its header, fix it
+        if pending_indent is not None and indent_level <= pending_indent:
+            indent_level = pending_indent + indent_size
+            lines[i] = " " * indent_level + line_stripped
+        pending_indent = None
+        if (line_stripped.endswith(":")
+                and line_stripped.lower().startswith(_PY_BLOCK_KW)):
+            pending_indent = indent_level
+    return "\n".join(lines)
+
+
+def _autopep8_pool() -> ProcessPoolExecutor:
+    """
+    Worker processes shared by all sessions for autopep8 runs, created on
+    first use. Keeps the GIL-bound autopep8 work off the server process so
+    concurrent users format in parallel and the UI stays responsive.
+    """
+    global _pool
+    with _POOL_LOCK:
+        if _pool is None:
+            # Spawn rather than fork: the Streamlit server process is
+            # multi-threaded
+            _pool = ProcessPoolExecutor(
+                max_workers=os.cpu_count(),
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def _discard_autopep8_pool(
+    pool: ProcessPoolExecutor, reason: str, terminate: bool = False
+) -> None:
+    """
+    Shut down pool and drop it so the next _autopep8_pool() call builds a
+    fresh one, unless another session has already replaced it. With
+    terminate, its worker processes are killed too, stopping jobs they are
+    still running.
+    """
+    global _pool
+    with _POOL_LOCK:
+        if _pool is not pool:
+            return
+        _pool = None
+    _log.warning("%s; replacing the autopep8 worker pool", reason)
+    if terminate:
+        # ProcessPoolExecutor only has a public way to stop running jobs
+        # from Python 3.14 on
+        terminate_workers = getattr(pool, "terminate_workers", None)
+        if terminate_workers is not None:
+            terminate_workers()
+            return
+        for process in list((pool._processes or {}).values()):
+            process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _submit_autopep8(pool: ProcessPoolExecutor, code: str) -> Optional[str]:
+    """
+    Run _autopep8_step on code in pool and wait for the result. A job that
+    exceeds _AUTOPEP8_TIMEOUT is cancelled; once it has left the pool's
+    queue that is only possible by replacing the pool and terminating its
+    workers, so a runaway run cannot hold a worker indefinitely.
+    """
+    future = pool.submit(_autopep8_step, code)
+    try:
+        result: Optional[str] = future.result(timeout=_AUTOPEP8_TIMEOUT)
+    except FutureTimeoutError:
+        if not future.cancel():
+            _discard_autopep8_pool(
+                pool,
+                f"autopep8 exceeded {_AUTOPEP8_TIMEOUT:g}s",
+                terminate=True
+            )
+        raise
+    return result
+
+
+def _autopep8_in_pool(code: str) -> Optional[str]:
+    """
+    _submit_autopep8, retrying once on a fresh pool if the one used was
+    broken by a dead worker (OOM, kill) or shut down by another session
+    replacing it.
+    """
+    pool = _autopep8_pool()
+    try:
+        return _submit_autopep8(pool, code)
+    except (BrokenProcessPool, CancelledError, RuntimeError):
+        _discard_autopep8_pool(pool, "autopep8 worker pool is broken")
+        return _submit_autopep8(_autopep8_pool(), code)
+
+
+def _is_pep8_clean(code: str) -> bool:
+    """
+    Cheap pre-check for _autopep8_step: True if the code parses and
+    pycodestyle reports nothing autopep8 would act on.
+    """
+    import autopep8  # type: ignore
+    import pycodestyle  # type: ignore
+
+    try:
+        ast.parse(code)
+    except SyntaxError:
+        return False
+    # Skip only the checks autopep8 ignores by default; anything else it
+    # would try to fix
+    checker = pycodestyle.Checker(
+        lines=code.splitlines(keepends=True),
+        quiet=True,
+        ignore=autopep8.DEFAULT_IGNORE.split(",")
+    )
+    return checker.check_all() == 0
+
+
+def _autopep8_step(code: str) -> Optional[str]:
+    """
+    Final step of format_python_code, run inside a pool worker so neither
+    the clean-code pre-check nor autopep8 runs in the server process.
+    Already clean code is returned as is (the repeat-click case); autopep8
+    would only add the final newline.
+
+    Returns None if autopep8 itself fails on the code, so any exception the
+    caller sees from the pool comes from the pool, not from the code.
+    """
+    import autopep8  # type: ignore
+
+    try:
+        # Terminate the last line with the newline style the code already
+        # uses, as autopep8 does
+        newline = autopep8.find_newline(code.splitlines(keepends=True))
+        candidate = code if code.endswith(("\r", "\n")) else code + newline
+        if _is_pep8_clean(candidate):
+            return candidate
+        # A single call; autopep8 iterates to convergence internally
+        result: str = autopep8.fix_code(code, options=_AUTOPEP8_OPTIONS)
+        return result
+    except Exception:
+        return None
+
+
+def format_python_code(raw_code: str, fix_blocks: bool) -> str:
+    """
+    Full pipeline for Python code formatting:
+      1) Preprocess uppercase keywords
+      2) Attempt block indentation fixes (when fix_blocks is set)
+      3) Use autopep8 for the final pass
+
+    Raises FormatterUnavailableError if the autopep8 worker pool fails or
+    times out.
+    """
+    # Step 1: Preprocess
+    code_step1 = preprocess_code_python(raw_code)
+
+    # Step 2: Indentation fixes (one pass already reaches the fixed point)
+    code_step2 = code_step1
+    if fix_blocks:
+        code_step2 = fix_block_indentation_python(code_step2, indent_size=4)
+
+    # Step 3: autopep8, in the worker pool
+    try:
+        result = _autopep8_in_pool(code_step2)
+    except FutureTimeoutError as e:
+        raise FormatterUnavailableError(
+            f"autopep8 took longer than {_AUTOPEP8_TIMEOUT:g}s",
+            code_step2,
+            can_retry=False
+        ) from e
+    except Exception as e:
+        # Anything else here comes from the pool (broken or shut down pool,
+        # cancelled job, pickling), never from autopep8 itself
+        raise FormatterUnavailableError(
+            "autopep8 worker pool failed", code_step2
+        ) from e
+    if result is None:
+        # If autopep8 itself fails (e.g., syntax error), return partial result
+        return code_step2
+    return result
+
+
+def minimal_cleanup_for_non_python(raw_code: str) -> str:
+    """
+    A minimal cleanup approach:
+      - Strip trailing spaces
+      - Remove excessive empty lines
+    """
+    return _REPEATED_BLANK.sub("", _TRAILING_WS.sub("", raw_code))
+
+
+def _format_bracketed(
+    raw_code: str,
+    start_re: Pattern[str],
+    end_re: Pattern[str],
+    else_re: Optional[Pattern[str]] = None
+) -> str:
+    """
+    Shared core of the keyword-bracketed formatters (SAS, VBA):
+      - Cleans up extra spaces and empty lines.
+      - Indents one level after lines matching start_re and dedents lines
+        matching end_re; lines matching else_re sit at the level of their
+        opening keyword.
+    """
+    cleaned = minimal_cleanup_for_non_python(raw_code)
+    lines = cleaned.split("\n")
+    formatted_lines: List[str] = []
+    indent_level = 0
+
+    for line in lines:
+        stripped = line.strip()
+        lower_stripped = stripped.lower()
+        # Check if the line is a block-ending keyword
+        if end_re.match(lower_stripped):
+            indent_level = max(indent_level - 1, 0)
+            formatted_lines.append("    " * indent_level + stripped)
+        # Special handling for Else to align with its opening keyword
+        elif else_re is not None and else_re.match(lower_stripped):
+            indent_level = max(indent_level - 1, 0)
+            formatted_lines.append("    " * indent_level + stripped)
+            indent_level += 1
+        else:
+            formatted_lines.append("    " * indent_level + stripped)
+            if start_re.match(lower_stripped):
+                indent_level += 1
+
+    return "\n".join(formatted_lines)
+
+
+def format_sas_code(raw_code: str) -> str:
+    """
+    A basic formatter for SAS code:
+      - Cleans up extra spaces and empty lines.
+      - Applies simple block indentation based on common SAS keywords.
+    """
+    return _format_bracketed(raw_code, _SAS_START, _SAS_END)
+
+
+def format_vba_code(raw_code: str) -> str:
+    """
+    A basic formatter for VBA code:
+      - Cleans up extra spaces and empty lines.
+      - Applies simple block indentation based on common VBA block keywords.
+    """
+    return _format_bracketed(raw_code, _VBA_START, _VBA_END, _VBA_ELSE)
@@ -0,0 +1,15 @@
+# Optional native build of the formatting helpers:
+#
+#     pip install mypy
+#     python setup.py build_ext --inplace
+#
+# The compiled extension is picked up in place of formatters.py by a plain
+# `import formatters`; without it the app runs on the pure-Python module.
+from setuptools import setup
+from mypyc.build import mypycify
+
+setup(
+    name="code-format",
+    py_modules=["formatters"],
+    ext_modules=mypycify(["formatters.py"]),
+)